@@ -2,34 +2,224 @@ import streamlit as st
 import pandas as pd
 import sqlite3
 import hashlib
+import hmac
+import io
+import datetime
+import atexit
+import contextlib
+import threading
 
 # --- 1. DATABASE & SECURITY CONFIG ---
+DB_FILE = 'inventory_final_v14.db'
+SCHEMA_VERSION = 4  # bump whenever init_db() gains new DDL
+MAX_TABLE_ROWS = 1000  # Dashboard rows serialized to the browser per render
+STATUS_OPTIONS = ["In Stock", "Out of Stock"]  # values of the generated assets.status column
+OPTIMIZE_INTERVAL = 4 * 3600  # seconds between background PRAGMA optimize runs
+OPTIMIZE_THREAD = 'sqlite-optimize'  # name of the timer thread, one chain per process
+
+# Shared SQL text; sqlite3's per-connection statement cache is keyed on it
+SQL_INSERT_ASSET = ('INSERT INTO assets (name, serial, category_id, purchase_date, location_id, quantity) '
+                    'VALUES (?, ?, (SELECT id FROM categories WHERE name=?), ?, (SELECT id FROM locations WHERE name=?), ?)')
+SQL_UPDATE_ASSET = 'UPDATE assets SET quantity=?, location_id=(SELECT id FROM locations WHERE name=?) WHERE id=?'
+
+# Store dates as ISO-8601 text (the implicit adapter is deprecated since Python 3.12)
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+
+def release_connection(conn):
+    # "Clear cache" drops the cached connection: close it now rather than holding it until exit.
+    # The hooks are bound methods, which compare equal across reruns (module functions don't).
+    atexit.unregister(conn.execute)
+    atexit.unregister(conn.close)
+    conn.execute('PRAGMA optimize')
+    conn.close()
+
+@st.cache_resource(on_release=release_connection)
 def get_connection():
-    return sqlite3.connect('inventory_final_v14.db', check_same_thread=False)
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    # page_size only takes effect on a new file, and must be set before the switch to WAL
+    conn.executescript('''PRAGMA page_size=8192;
+                          PRAGMA journal_mode=WAL;
+                          PRAGMA synchronous=NORMAL;
+                          PRAGMA temp_store=MEMORY;
+                          PRAGMA cache_size=-20000;
+                          PRAGMA mmap_size=268435456;
+                          PRAGMA trusted_schema=OFF;
+                          PRAGMA analysis_limit=1000;''')
+    # Refresh planner statistics at shutdown; schedule_optimize() covers startup and the long run
+    atexit.register(conn.close)
+    atexit.register(conn.execute, 'PRAGMA optimize')  # atexit runs last-in first-out
+    return conn
+
+@st.cache_resource
+def write_lock():
+    # Cached like the connection: a plain module-level lock would be re-created on every rerun
+    return threading.Lock()
+
+@contextlib.contextmanager
+def db_write():
+    # All sessions share one connection, so a rollback would also undo another session's
+    # uncommitted statements; hold the lock for the whole transaction.
+    with write_lock(), get_connection() as conn:
+        yield conn
 
 def make_hashes(password):
-    return hashlib.sha256(str.encode(password)).hexdigest()
+    return hashlib.sha256(password.encode()).hexdigest()
 
 def check_hashes(password, hashed_text):
-    if make_hashes(password) == hashed_text:
+    if hmac.compare_digest(make_hashes(password), hashed_text):
         return hashed_text
     return False
 
+@st.cache_resource
 def init_db():
     conn = get_connection()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return True
     c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS assets 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, serial TEXT, 
-                  category TEXT, purchase_date TEXT, location TEXT, status TEXT, quantity INTEGER)''')
-    c.execute('CREATE TABLE IF NOT EXISTS categories (name TEXT PRIMARY KEY)')
-    c.execute('CREATE TABLE IF NOT EXISTS locations (name TEXT PRIMARY KEY)')
-    c.execute('CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, role TEXT)')
-    
-    admin_hash = make_hashes('password123')
-    c.execute('INSERT OR IGNORE INTO users (username, password, role) VALUES (?,?,?)', ('admin', admin_hash, 'Admin'))
-    conn.commit()
+    # One transaction for the whole bootstrap; sqlite3 does not open one implicitly for DDL
+    with db_write():
+        c.execute('BEGIN IMMEDIATE')
+        # Version 4 stores category/location as ids and derives status. Older files keep
+        # text columns (and a stored status): move them aside and copy them in below.
+        legacy = version < 4 and 'category' in [r[1] for r in c.execute('PRAGMA table_info(assets)')]
+        if legacy:
+            c.execute('DROP VIEW IF EXISTS asset_view')
+            for table in ('assets', 'categories', 'locations'):
+                c.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+        c.execute('CREATE TABLE IF NOT EXISTS categories (id INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+        c.execute('CREATE TABLE IF NOT EXISTS locations (id INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+        # category/location are stored as integer ids into the lookup tables above
+        c.execute('''CREATE TABLE IF NOT EXISTS assets 
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, serial TEXT, 
+                      category_id INTEGER REFERENCES categories(id), purchase_date TEXT,
+                      location_id INTEGER REFERENCES locations(id),
+                      status TEXT GENERATED ALWAYS AS (CASE WHEN quantity = 0 THEN 'Out of Stock' ELSE 'In Stock' END) VIRTUAL,
+                      quantity INTEGER)''')
+        if legacy:
+            c.execute('''INSERT INTO categories (name) SELECT name FROM categories_old
+                         UNION SELECT category FROM assets_old WHERE category IS NOT NULL''')
+            c.execute('''INSERT INTO locations (name) SELECT name FROM locations_old
+                         UNION SELECT location FROM assets_old WHERE location IS NOT NULL''')
+            c.execute('''INSERT INTO assets (id, name, serial, category_id, purchase_date, location_id, quantity)
+                         SELECT a.id, a.name, a.serial, c.id, a.purchase_date, l.id, a.quantity FROM assets_old a
+                         LEFT JOIN categories c ON c.name = a.category LEFT JOIN locations l ON l.name = a.location''')
+            for table in ('assets', 'categories', 'locations'):
+                c.execute(f'DROP TABLE {table}_old')
+        c.execute('''CREATE VIEW IF NOT EXISTS asset_view AS
+                     SELECT a.id, a.name, a.serial, c.name AS category, a.purchase_date, l.name AS location, a.status, a.quantity
+                     FROM assets a LEFT JOIN categories c ON c.id = a.category_id LEFT JOIN locations l ON l.id = a.location_id''')
+        c.execute('CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, role TEXT)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_assets_name ON assets(name)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_assets_serial ON assets(serial)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_assets_category ON assets(category_id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_assets_location ON assets(location_id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_assets_purchase_date ON assets(purchase_date)')
+        # Partial index: only the rows the Low Stock report ever reads
+        c.execute('CREATE INDEX IF NOT EXISTS idx_assets_lowstock ON assets(quantity) WHERE quantity <= 5')
+
+        if c.execute('SELECT 1 FROM users LIMIT 1').fetchone() is None:
+            c.execute('INSERT INTO users (username, password, role) VALUES (?,?,?)', ('admin', make_hashes('password123'), 'Admin'))
+        # Fresh planner stats for the new or migrated schema (bounded by analysis_limit)
+        c.execute('ANALYZE')
+        c.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+    return True
+
+def asset_filter_sql(has_search, n_statuses, n_locations):
+    # The SQL text depends only on the filter shape; the values are always bound as parameters
+    where = []
+    if has_search:
+        where.append("(name LIKE ? ESCAPE '\\' OR serial LIKE ? ESCAPE '\\' OR category LIKE ? ESCAPE '\\')")
+    if n_statuses:
+        where.append(f"status IN ({','.join('?' * n_statuses)})")
+    if n_locations:
+        where.append(f"location IN ({','.join('?' * n_locations)})")
+    sql = 'SELECT id, name, serial, category, purchase_date, location, status, quantity FROM asset_view'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return sql
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def load_assets(version, search='', statuses=(), locations=()):
+    params = []
+    if search:
+        # Escape LIKE wildcards so the term is matched as a plain substring
+        needle = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params += [f'%{needle}%'] * 3
+    params += list(statuses) + list(locations)
+    sql = asset_filter_sql(bool(search), len(statuses), len(locations))
+    df = pd.read_sql(sql, get_connection(), params=params, dtype={'quantity': 'int32'})
+    # Low-cardinality columns are kept as codes to shrink the cached frame
+    for col in ('category', 'location', 'status'):
+        df[col] = df[col].astype('category')
+    return df
+
+@st.cache_data(show_spinner=False)
+def list_names(table, version):
+    return [r[0] for r in get_connection().execute(f'SELECT DISTINCT name FROM {table} ORDER BY name').fetchall()]
+
+@st.cache_data(show_spinner=False)
+def has_assets(version):
+    return get_connection().execute('SELECT 1 FROM assets LIMIT 1').fetchone() is not None
+
+@st.cache_data(show_spinner=False)
+def asset_labels(version):
+    rows = get_connection().execute('SELECT id, name, serial FROM assets ORDER BY name').fetchall()
+    return {i: f"{n} ({sn})" if sn else n for i, n, sn in rows}
+
+def db_version():
+    # Bumped by commits from other connections; this process's own writes clear the caches explicitly
+    return get_connection().execute('PRAGMA data_version').fetchone()[0]
+
+def to_csv_bytes(df):
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, encoding='utf-8')
+    return buf.getvalue()
+
+@st.cache_data(show_spinner=False)
+def load_report(version, location=None):
+    # Returns the frame and its CSV export so reruns don't re-encode an unchanged report
+    if location is None:
+        cur = get_connection().execute('SELECT * FROM asset_view WHERE quantity <= 5')
+    else:
+        cur = get_connection().execute('SELECT * FROM asset_view WHERE location = ?', (location,))
+    df = pd.DataFrame.from_records(cur.fetchall(), columns=[d[0] for d in cur.description])
+    return df, to_csv_bytes(df)
+
+def clear_asset_caches():
+    load_assets.clear()
+    has_assets.clear()
+    asset_labels.clear()
+    load_report.clear()
+
+@st.cache_resource
+def schedule_optimize():
+    # Long-lived servers: refresh planner stats periodically (bounded by analysis_limit).
+    # cache_resource skips this on reruns, but "Clear cache" empties it, so look for a live chain too.
+    # First run now, after init_db() (0x10002 = check every table, on SQLite 3.46+).
+    with write_lock():
+        get_connection().execute('PRAGMA optimize=0x10002')
+    def run():
+        try:
+            # Own short-lived connection, so ANALYZE never lands inside a session's open transaction
+            with contextlib.closing(sqlite3.connect(DB_FILE)) as db:
+                db.execute('PRAGMA analysis_limit=1000')
+                db.execute('PRAGMA optimize=0x10002')
+        finally:
+            # Keep the chain alive even if this run failed (e.g. database is locked)
+            start()
+    def start():
+        timer = threading.Timer(OPTIMIZE_INTERVAL, run)
+        timer.name = OPTIMIZE_THREAD
+        timer.daemon = True
+        timer.start()
+    if not any(t.name == OPTIMIZE_THREAD and t.is_alive() for t in threading.enumerate()):
+        start()
+    return True
 
 init_db()
+schedule_optimize()
+conn = get_connection()
 
 # --- 2. LOGIN SESSION STATE ---
 if 'logged_in' not in st.session_state:
@@ -43,7 +233,6 @@ if not st.session_state['logged_in']:
     username = st.sidebar.text_input("Username")
     password = st.sidebar.text_input("Password", type='password')
     if st.sidebar.button("Login"):
-        conn = get_connection()
         c = conn.cursor()
         c.execute('SELECT * FROM users WHERE username = ?', (username,))
         user_data = c.fetchone()
@@ -62,7 +251,45 @@ else:
         st.session_state['role'] = None
         st.rerun()
 
-# --- 4. MAIN APP CONTENT ---
+# --- 4. FRAGMENTED VIEWS ---
+# Widgets inside a fragment only rerun the fragment, not the whole script
+@st.fragment
+def dashboard_view():
+    version = db_version()
+    if has_assets(version):
+        col_s1, col_s2, col_s3 = st.columns(3)
+        with col_s1:
+            search = st.text_input("Search (Name/Serial/Category)")
+        with col_s2:
+            status_filter = st.multiselect("Filter by Status", STATUS_OPTIONS)
+        with col_s3:
+            loc_list_db = list_names('locations', version)
+            loc_filter = st.multiselect("Filter by Location", loc_list_db)
+
+        df = load_assets(version, search, status_filter, loc_filter)
+        if len(df) > MAX_TABLE_ROWS:
+            st.caption(f"Showing first {MAX_TABLE_ROWS} of {len(df)} matches. Refine the search to narrow it down.")
+        st.dataframe(df.head(MAX_TABLE_ROWS), use_container_width=True)
+    else:
+        st.info("Inventory is empty.")
+
+@st.fragment
+def reports_view():
+    rep = st.radio("Type", ["Location Report", "Low Stock Alert (<= 5)"])
+    version = db_version()
+    if rep == "Location Report":
+        lo = list_names('locations', version)
+        if lo:
+            ls = st.selectbox("Select Location", lo)
+            res, csv = load_report(version, ls)
+            st.dataframe(res)
+            st.download_button(label="📥 Export Location Report (CSV)", data=csv, file_name="location_report.csv", mime="text/csv")
+    else:
+        res, csv = load_report(version)
+        st.dataframe(res)
+        st.download_button(label="📥 Export Low Stock Report (CSV)", data=csv, file_name="low_stock_report.csv", mime="text/csv")
+
+# --- 5. MAIN APP CONTENT ---
 if st.session_state['logged_in']:
     user_role = st.session_state['role']
     st.title("🛡️ Asset & Inventory System")
@@ -72,42 +299,19 @@ if st.session_state['logged_in']:
         menu.append("User Management")
         
     choice = st.sidebar.selectbox("Navigation", menu)
-    conn = get_connection()
 
     # --- DASHBOARD (SEARCH & FILTERING) ---
     if choice == "Dashboard":
         st.header("🔍 Inventory Overview")
-        df = pd.read_sql('SELECT * FROM assets', conn)
-        if not df.empty:
-            df.loc[df['quantity'] == 0, 'status'] = 'Out of Stock'
-            df.loc[df['quantity'] > 0, 'status'] = 'In Stock'
-            
-            col_s1, col_s2, col_s3 = st.columns(3)
-            with col_s1:
-                search = st.text_input("Search (Name/Serial/Category)")
-            with col_s2:
-                status_filter = st.multiselect("Filter by Status", ["In Stock", "Out of Stock"])
-            with col_s3:
-                loc_list_db = [r[0] for r in conn.execute('SELECT name FROM locations').fetchall()]
-                loc_filter = st.multiselect("Filter by Location", loc_list_db)
-
-            if search:
-                df = df[df['name'].str.contains(search, case=False) | df['serial'].str.contains(search, case=False) | df['category'].str.contains(search, case=False)]
-            if status_filter:
-                df = df[df['status'].isin(status_filter)]
-            if loc_filter:
-                df = df[df['location'].isin(loc_filter)]
-            st.dataframe(df, use_container_width=True)
-        else:
-            st.info("Inventory is empty.")
+        dashboard_view()
 
     # --- MANAGE ASSETS ---
     elif choice == "Manage Assets":
         if user_role == "Admin":
             st.subheader("➕ Add New Asset")
             st.caption("⚠️ Only Admin is authorized to add new assets.")
-            cat_list = [row[0] for row in conn.execute('SELECT name FROM categories').fetchall()]
-            loc_list = [row[0] for row in conn.execute('SELECT name FROM locations').fetchall()]
+            cat_list = list_names('categories', db_version())
+            loc_list = list_names('locations', db_version())
             if not cat_list or not loc_list:
                 st.warning("Please add Categories and Locations first!")
             else:
@@ -121,58 +325,92 @@ if st.session_state['logged_in']:
                         loc = st.selectbox("Location", loc_list)
                         p_date = st.date_input("Purchase Date")
                     if st.form_submit_button("Save Asset"):
-                        status = "In Stock" if qty > 0 else "Out of Stock"
-                        conn.execute('INSERT INTO assets (name, serial, category, purchase_date, location, status, quantity) VALUES (?,?,?,?,?,?,?)', (name, serial, category, str(p_date), loc, status, qty))
-                        conn.commit(); st.success(f"Added {name}")
+                        with db_write(): conn.execute(SQL_INSERT_ASSET, (name, serial, category, p_date, loc, qty))
+                        clear_asset_caches(); st.success(f"Added {name}")
+            # Outside the guard above: the import creates any missing categories/locations itself
+            with st.expander("📤 Bulk Import CSV"):
+                bulk_cols = ['name', 'serial', 'category', 'purchase_date', 'location', 'quantity']
+                up = st.file_uploader("CSV columns: " + ", ".join(bulk_cols), type="csv", key="bulk_csv")
+                if up is not None and st.button("Import Assets", key="bulk_import_btn"):
+                    try:
+                        df_up = pd.read_csv(up, dtype=str)
+                    except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError) as e:
+                        df_up = None
+                        st.error(f"Could not read CSV: {e}")
+                    missing = [] if df_up is None else [col for col in bulk_cols if col not in df_up.columns]
+                    if missing:
+                        st.error(f"Missing columns: {', '.join(missing)}")
+                    elif df_up is not None:
+                        df_up = df_up[bulk_cols]
+                        qty_up = pd.to_numeric(df_up['quantity'], errors='coerce')
+                        date_up = pd.to_datetime(df_up['purchase_date'], format='ISO8601', errors='coerce')
+                        # Same rule as the Add form: whole numbers >= 0 (NaN and inf fail both checks)
+                        bad_qty = ~((qty_up >= 0) & (qty_up % 1 == 0))
+                        # Blank dates are stored as NULL; anything else must be ISO-8601 like the Add form stores
+                        bad_date = date_up.isna() & df_up['purchase_date'].notna()
+                        valid = ~(bad_qty | bad_date)
+                        df_up = df_up[valid].assign(
+                            quantity=qty_up[valid].astype(int),
+                            purchase_date=date_up[valid].dt.date,
+                        ).astype(object)
+                        rows = df_up.where(df_up.notna(), None).itertuples(index=False, name=None)
+                        with db_write():
+                            # Unknown categories/locations are created so their ids resolve
+                            conn.executemany('INSERT OR IGNORE INTO categories (name) VALUES (?)', [(v,) for v in df_up['category'].dropna().unique()])
+                            conn.executemany('INSERT OR IGNORE INTO locations (name) VALUES (?)', [(v,) for v in df_up['location'].dropna().unique()])
+                            conn.executemany(SQL_INSERT_ASSET, rows)
+                        clear_asset_caches(); list_names.clear(); st.success(f"Imported {len(df_up)} assets")
+                        if bad_qty.any():
+                            st.warning(f"Skipped {int(bad_qty.sum())} rows with a missing, negative or fractional quantity")
+                        if bad_date.any():
+                            st.warning(f"Skipped {int(bad_date.sum())} rows with a purchase date not in YYYY-MM-DD form")
 
         if user_role in ["Admin", "Manager"]:
             st.divider(); st.subheader("🔄 Update Status/Location")
             st.caption("⚠️ Only Admin and Manager are authorized to update assets.")
-            asset_query = pd.read_sql('SELECT * FROM assets', conn)
-            if not asset_query.empty:
-                target = st.selectbox("Select Asset to Update", asset_query['name'].tolist(), key="asset_update_list")
-                row = asset_query[asset_query['name'] == target].iloc[0]
-                st.info(f"**Current:** Qty: {int(row['quantity'])} | Loc: {row['location']}")
+            labels = asset_labels(db_version())
+            if labels:
+                target = st.selectbox("Select Asset to Update", list(labels), format_func=labels.get, key="asset_update_list")
+                curr_qty, curr_loc = conn.execute('SELECT quantity, location FROM asset_view WHERE id=?', (target,)).fetchone()
+                st.info(f"**Current:** Qty: {int(curr_qty)} | Loc: {curr_loc}")
                 u1, u2 = st.columns(2)
-                with u1: new_qty = st.number_input("New Quantity", min_value=0, value=int(row['quantity']))
+                with u1: new_qty = st.number_input("New Quantity", min_value=0, value=int(curr_qty))
                 with u2: 
-                    l_opts = [r[0] for r in conn.execute('SELECT name FROM locations').fetchall()]
-                    curr_idx = l_opts.index(row['location']) if row['location'] in l_opts else 0
+                    l_opts = list_names('locations', db_version())
+                    curr_idx = l_opts.index(curr_loc) if curr_loc in l_opts else 0
                     new_loc = st.selectbox("New Location", l_opts, index=curr_idx)
                 if st.button("Apply Changes"):
-                    new_status = "In Stock" if new_qty > 0 else "Out of Stock"
-                    conn.execute('UPDATE assets SET quantity=?, location=?, status=? WHERE name=?', (new_qty, new_loc, new_status, target))
-                    conn.commit(); st.success("Updated!"); st.rerun()
+                    with db_write(): conn.execute(SQL_UPDATE_ASSET, (new_qty, new_loc, target))
+                    clear_asset_caches(); st.success("Updated!"); st.rerun()
 
     # --- CATEGORY SETTINGS ---
     elif choice == "Category Settings":
         if user_role == "Admin":
             st.subheader("📂 Manage Categories")
             st.caption("⚠️ Only Admin is authorized to manage categories.")
+            cats = list_names('categories', db_version())
             with st.expander("➕ Add"):
                 n_cat = st.text_input("New Category Name", key="add_cat_input")
                 if st.button("Save Category", key="add_cat_btn"): 
                     if n_cat: 
-                        conn.execute('INSERT OR IGNORE INTO categories VALUES (?)', (n_cat,))
-                        conn.commit(); st.toast(f"Category '{n_cat}' Added!"); st.rerun()
+                        with db_write(): conn.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (n_cat,))
+                        list_names.clear(); st.toast(f"Category '{n_cat}' Added!"); st.rerun()
             with st.expander("📝 Edit"):
-                c_list = [r[0] for r in conn.execute('SELECT name FROM categories').fetchall()]
-                if c_list:
-                    old_c = st.selectbox("Select Category", c_list, key="edit_cat_select")
+                if cats:
+                    old_c = st.selectbox("Select Category", cats, key="edit_cat_select")
                     ren_c = st.text_input("New Name", key="edit_cat_input")
                     if st.button("Update Name", key="edit_cat_btn"):
                         if ren_c: 
-                            conn.execute('UPDATE categories SET name=? WHERE name=?', (ren_c, old_c))
-                            conn.commit(); st.toast("Category Updated!"); st.rerun()
+                            with db_write(): conn.execute('UPDATE categories SET name=? WHERE name=?', (ren_c, old_c))
+                            list_names.clear(); clear_asset_caches(); st.toast("Category Updated!"); st.rerun()
             with st.expander("🗑️ Delete"):
-                d_list = [r[0] for r in conn.execute('SELECT name FROM categories').fetchall()]
-                if d_list:
-                    d_cat = st.selectbox("Remove Category", d_list, key="del_cat_select")
+                if cats:
+                    d_cat = st.selectbox("Remove Category", cats, key="del_cat_select")
                     if st.button("Delete Category", key="del_cat_btn"):
-                        check = conn.execute('SELECT count(*) FROM assets WHERE category=?', (d_cat,)).fetchone()[0]
+                        check = conn.execute('SELECT count(*) FROM assets WHERE category_id=(SELECT id FROM categories WHERE name=?)', (d_cat,)).fetchone()[0]
                         if check == 0:
-                            conn.execute('DELETE FROM categories WHERE name=?', (d_cat,))
-                            conn.commit(); st.toast("Category Deleted!"); st.rerun()
+                            with db_write(): conn.execute('DELETE FROM categories WHERE name=?', (d_cat,))
+                            list_names.clear(); st.toast("Category Deleted!"); st.rerun()
                         else: st.error(f"Cannot delete! Category '{d_cat}' is in use.")
         else: st.error("Admin Only.")
 
@@ -181,30 +419,29 @@ if st.session_state['logged_in']:
         if user_role == "Admin":
             st.subheader("📍 Manage Locations")
             st.caption("⚠️ Only Admin is authorized to manage locations.")
+            locs = list_names('locations', db_version())
             with st.expander("➕ Add"):
                 n_loc = st.text_input("New Location Name", key="add_loc_input")
                 if st.button("Save Location", key="add_loc_btn"): 
                     if n_loc: 
-                        conn.execute('INSERT OR IGNORE INTO locations VALUES (?)', (n_loc,))
-                        conn.commit(); st.toast(f"Location '{n_loc}' Added!"); st.rerun()
+                        with db_write(): conn.execute('INSERT OR IGNORE INTO locations (name) VALUES (?)', (n_loc,))
+                        list_names.clear(); st.toast(f"Location '{n_loc}' Added!"); st.rerun()
             with st.expander("📝 Edit"):
-                l_list = [r[0] for r in conn.execute('SELECT name FROM locations').fetchall()]
-                if l_list:
-                    old_l = st.selectbox("Select Location", l_list, key="edit_loc_select")
+                if locs:
+                    old_l = st.selectbox("Select Location", locs, key="edit_loc_select")
                     ren_l = st.text_input("New Name", key="edit_loc_input")
                     if st.button("Update Name", key="edit_loc_btn"):
                         if ren_l: 
-                            conn.execute('UPDATE locations SET name=? WHERE name=?', (ren_l, old_l))
-                            conn.commit(); st.toast("Location Updated!"); st.rerun()
+                            with db_write(): conn.execute('UPDATE locations SET name=? WHERE name=?', (ren_l, old_l))
+                            list_names.clear(); clear_asset_caches(); st.toast("Location Updated!"); st.rerun()
             with st.expander("🗑️ Delete"):
-                dl_list = [r[0] for r in conn.execute('SELECT name FROM locations').fetchall()]
-                if dl_list:
-                    d_loc = st.selectbox("Remove Location", dl_list, key="del_loc_select")
+                if locs:
+                    d_loc = st.selectbox("Remove Location", locs, key="del_loc_select")
                     if st.button("Delete Location", key="del_loc_btn"):
-                        check = conn.execute('SELECT count(*) FROM assets WHERE location=?', (d_loc,)).fetchone()[0]
+                        check = conn.execute('SELECT count(*) FROM assets WHERE location_id=(SELECT id FROM locations WHERE name=?)', (d_loc,)).fetchone()[0]
                         if check == 0:
-                            conn.execute('DELETE FROM locations WHERE name=?', (d_loc,))
-                            conn.commit(); st.toast("Location Deleted!"); st.rerun()
+                            with db_write(): conn.execute('DELETE FROM locations WHERE name=?', (d_loc,))
+                            list_names.clear(); st.toast("Location Deleted!"); st.rerun()
                         else: st.error(f"Cannot delete! Location '{d_loc}' is in use.")
         else: st.error("Admin Only.")
 
@@ -216,31 +453,15 @@ if st.session_state['logged_in']:
             new_u, new_p = st.text_input("Username"), st.text_input("Password", type='password')
             new_r = st.selectbox("Role", ["Admin", "Manager", "Viewer"])
             if st.form_submit_button("Create User"):
-                try:
-                    conn.execute('INSERT INTO users VALUES (?,?,?)', (new_u, make_hashes(new_p), new_r))
-                    conn.commit(); st.success(f"User {new_u} created!")
-                except: st.error("User already exists")
-        st.table(pd.read_sql('SELECT username, role FROM users', conn))
+                with db_write(): cur = conn.execute('INSERT OR IGNORE INTO users VALUES (?,?,?)', (new_u, make_hashes(new_p), new_r))
+                if cur.rowcount == 1: st.success(f"User {new_u} created!")
+                else: st.error("User already exists")
+        st.table([{'username': u, 'role': r} for u, r in conn.execute('SELECT username, role FROM users').fetchall()])
 
     # --- REPORTS ---
     elif choice == "Reports":
         st.header("📊 Reports")
-        rep = st.radio("Type", ["Location Report", "Low Stock Alert (<= 5)"])
-        df_r = pd.read_sql('SELECT * FROM assets', conn)
-        if not df_r.empty:
-            df_r.loc[df_r['quantity'] == 0, 'status'] = 'Out of Stock'
-            df_r.loc[df_r['quantity'] > 0, 'status'] = 'In Stock'
-            if rep == "Location Report":
-                lo = [r[0] for r in conn.execute('SELECT name FROM locations').fetchall()]
-                if lo:
-                    ls = st.selectbox("Select Location", lo)
-                    res = df_r[df_r['location'] == ls]
-                    st.dataframe(res)
-                    st.download_button(label="📥 Export Location Report (CSV)", data=res.to_csv(index=False).encode('utf-8'), file_name="location_report.csv", mime="text/csv")
-            else:
-                res = df_r[df_r['quantity'] <= 5]
-                st.dataframe(res)
-                st.download_button(label="📥 Export Low Stock Report (CSV)", data=res.to_csv(index=False).encode('utf-8'), file_name="low_stock_report.csv", mime="text/csv")
+        reports_view()
 else:
     st.title("🔒 Restricted Access")
     st.info("Please enter credentials in the sidebar.")